@@ -11,12 +11,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-if "bpy" in locals():
+import os
+
+# Reloading submodules is only useful when working on the add-on from a git
+# checkout; installed extensions never have stale submodules.
+_DEV = os.path.isdir(os.path.join(os.path.dirname(__file__), "..", ".git"))
+
+if "bpy" in locals() and _DEV:
     import importlib
-    importlib.reload(gui)
-    importlib.reload(operators)
-    importlib.reload(preferences)
+    # Reload every submodule once, dependencies first, so the submodules
+    # themselves can use plain imports.
+    importlib.reload(enums)
+    importlib.reload(mesh_analysis)
+    importlib.reload(packing)
+    importlib.reload(svg_export)
     importlib.reload(props)
+    importlib.reload(preferences)
+    importlib.reload(operators)
+    importlib.reload(gui)
 else:
     from . import gui
     from . import operators
@@ -29,10 +41,7 @@ import bpy
 classes = (
     preferences.LasercutSvgExportPreferences,
     gui.LASERCUTSVGEXPORT_PT_sidepanel,
-    gui.LASERCUTSVGEXPORT_PT_objects,
-    gui.LASERCUTSVGEXPORT_PT_edit_ops,
-    gui.LASERCUTSVGEXPORT_PT_faces,
-    gui.LASERCUTSVGEXPORT_PT_edges,
+    # The child panels in gui.child_panels are registered on first draw of the side panel.
     operators.EXPORT_MESH_OT_lasercut_svg_export,
     operators.LASERCUTSVGEXPORT_OT_setup_scene,
     operators.LASERCUTSVGEXPORT_OT_scale_scene,
@@ -65,8 +74,10 @@ def register() -> None:
 
 def unregister() -> None:
     bpy.types.TOPBAR_MT_file_export.remove(_export_menu)
+    preferences.cancel_defaults_update()
     props.unregister_object_props()
     props.unregister_scene_props()
+    gui.unregister_child_panels()
     _unregister()
 
 # XXX shown in tissue add-on, unknown purpose
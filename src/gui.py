@@ -13,6 +13,15 @@
 
 import bpy
 
+_SIDEPANEL_PROPS = (
+    "lasercut_svg_export_laser_width",
+    "lasercut_svg_export_material_width",
+    "lasercut_svg_export_material_length",
+    "lasercut_svg_export_material_thickness",
+    "lasercut_svg_export_margin",
+    "lasercut_svg_export_shape_padding",
+)
+
 
 class LasercutSvgExportPanel:
     bl_space_type = "VIEW_3D"
@@ -24,24 +33,25 @@ class LASERCUTSVGEXPORT_PT_sidepanel(LasercutSvgExportPanel, bpy.types.Panel):
     bl_label = "Lasercut SVG Export"
 
     def draw(self, context: bpy.types.Context) -> None:
+        if not _children_registered:
+            _schedule_children_registration()
+
         layout = self.layout
+        scene = context.scene
         col = layout.column(align=True)
         col.use_property_split = True
         col.use_property_decorate = False
-        col.prop(context.scene, "lasercut_svg_export_laser_width")
-        col.prop(context.scene, "lasercut_svg_export_material_width")
-        col.prop(context.scene, "lasercut_svg_export_material_length")
-        col.prop(context.scene, "lasercut_svg_export_material_thickness")
-        col.prop(context.scene, "lasercut_svg_export_margin")
-        col.prop(context.scene, "lasercut_svg_export_shape_padding")
+        prop = col.prop
+        for name in _SIDEPANEL_PROPS:
+            prop(scene, name)
         col.operator("lasercut_svg_export.setup_scene", icon="TOOL_SETTINGS")
         col.operator("lasercut_svg_export.scale_scene", icon="ZOOM_IN")
 
         col = layout.column(align=True)
         col.use_property_split = False
         col.label(text="Packing Options:")
-        col.prop(context.scene, "lasercut_svg_export_pack_may_rotate")
-        col.prop(context.scene, "lasercut_svg_export_pack_sort", text="")
+        col.prop(scene, "lasercut_svg_export_pack_may_rotate")
+        col.prop(scene, "lasercut_svg_export_pack_sort", text="")
 
         layout.operator("export_mesh.lasercut_svg_export", icon="EXPORT")
 
@@ -122,3 +132,44 @@ class LASERCUTSVGEXPORT_PT_edges(LasercutSvgExportPanel, bpy.types.Panel):
         row.operator("mesh.mark_sharp", text="", icon="X").clear = True
         row.operator("mesh.mark_sharp", text="",
                      icon="CHECKMARK").clear = False
+
+
+# Child panels are only registered once the side panel is drawn for the first
+# time, so that enabling the add-on doesn't pay for panels nobody looks at.
+child_panels = (
+    LASERCUTSVGEXPORT_PT_objects,
+    LASERCUTSVGEXPORT_PT_edit_ops,
+    LASERCUTSVGEXPORT_PT_faces,
+    LASERCUTSVGEXPORT_PT_edges,
+)
+
+_children_registered = False
+
+
+def _schedule_children_registration() -> None:
+    # Classes cannot be registered from within a draw() callback, so defer it
+    # to a timer that runs right after the current redraw.
+    if bpy.app.timers.is_registered(_ensure_children_registered):
+        return
+    bpy.app.timers.register(_ensure_children_registered, first_interval=0.0)
+
+
+def _ensure_children_registered() -> None:
+    global _children_registered
+    if _children_registered:
+        return None
+    for cls in child_panels:
+        bpy.utils.register_class(cls)
+    _children_registered = True
+    return None  # Don't repeat the timer.
+
+
+def unregister_child_panels() -> None:
+    global _children_registered
+    if bpy.app.timers.is_registered(_ensure_children_registered):
+        bpy.app.timers.unregister(_ensure_children_registered)
+    if not _children_registered:
+        return
+    for cls in reversed(child_panels):
+        bpy.utils.unregister_class(cls)
+    _children_registered = False
@@ -11,18 +11,27 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import sys
-import doctest
+import logging
 from typing import Iterable, Optional, TYPE_CHECKING, Iterator, cast
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections import defaultdict
+from itertools import chain
 from contextlib import contextmanager
 from enum import Enum
 
 import bpy
 import bmesh
+import numpy as np
 from mathutils import Vector, Matrix
 
+try:
+    from numba import njit
+except ImportError:
+    # Blender doesn't come with Numba, so it's optional.
+    njit = None
+
+logger = logging.getLogger(__name__)
+
 # Blender doesn't differentiate between vector sizes, but I do.
 if TYPE_CHECKING:
     # But Blender doesn't come with the `typing_extensions` module, so be
@@ -57,6 +66,8 @@ class Options:
     """Whether the packing algorithm is allowed to rotate shapes."""
     shape_table: bool
     """Whether to put the table of shape sizes in the SVG."""
+    svg_precision: int = 3
+    """Number of decimals for coordinates in the SVG."""
 
     def page_offset(self, page_index: int) -> float:
         "X-offset to put elements on the given page."
@@ -78,6 +89,22 @@ class MeshType(Enum):
             return cls.ENGRAVE
         return cls.CUT
 
+    def to_int(self) -> int:
+        """Return the integer tag of this mesh type, as used in arrays."""
+        return _MESH_TYPES.index(self)
+
+    @classmethod
+    def from_int(cls, tag: int) -> "MeshType":
+        """Return the mesh type for the given integer tag."""
+        return _MESH_TYPES[tag]
+
+
+# Integer tags of the mesh types. These are used in arrays and hot loops,
+# where comparing Enum members would be needlessly slow.
+_CUT = 0
+_ENGRAVE = 1
+_MESH_TYPES = (MeshType.CUT, MeshType.ENGRAVE)
+
 
 @dataclass
 class AnnotatedMesh:
@@ -87,8 +114,25 @@ class AnnotatedMesh:
         self.edges.append(edge)
 
     def flattened(self, drop_axis: int) -> "FlattenedMesh":
-        flattened_edges = [e.flattened(drop_axis) for e in self.edges]
-        return FlattenedMesh(edges=flattened_edges)
+        keep_axes = list(_AXIS_KEEP[drop_axis])
+        num_edges = len(self.edges)
+        verts = np.array(
+            [e.verts for e in self.edges], dtype=np.float32
+        ).reshape(num_edges, 2, 3)
+        etype = np.fromiter(
+            (e.edgeType.to_int() for e in self.edges),
+            dtype=np.uint8,
+            count=num_edges,
+        )
+        return FlattenedMesh(
+            v0=verts[:, 0, keep_axes],
+            v1=verts[:, 1, keep_axes],
+            etype=etype,
+        )
+
+
+# Axes kept when flattening, indexed by the axis to drop.
+_AXIS_KEEP = ((1, 2), (0, 2), (0, 1))
 
 
 @dataclass
@@ -96,76 +140,150 @@ class AnnotatedEdge:
     verts: tuple[Vector3, Vector3]
     edgeType: MeshType
 
-    def flattened(self, drop_axis: int) -> "FlattenedEdge":
-        vectors2d = []
-        for vect3d in self.verts:
-            point2d = tuple(vect3d[i] for i in range(3) if i != drop_axis)
-            vect2d = Vector2(point2d)
-            vectors2d.append(vect2d)
-        assert len(vectors2d) == 2
-        flat_verts: tuple[Vector2, Vector2] = tuple(vectors2d)  # type: ignore
-        return FlattenedEdge(verts=flat_verts, edgeType=self.edgeType)
+
+def _empty_points() -> np.ndarray:
+    return np.empty((0, 2), dtype=np.float32)
+
+
+def _empty_types() -> np.ndarray:
+    return np.empty(0, dtype=np.uint8)
 
 
 @dataclass
 class FlattenedMesh:
-    edges: list["FlattenedEdge"]
+    """2D edges, stored as parallel arrays.
+
+    Edge `i` runs from `v0[i]` to `v1[i]`, and its mesh type is
+    `MeshType.from_int(etype[i])`.
+    """
+
+    v0: np.ndarray = field(default_factory=_empty_points)
+    """(N, 2) float32 array of edge start points."""
+    v1: np.ndarray = field(default_factory=_empty_points)
+    """(N, 2) float32 array of edge end points."""
+    etype: np.ndarray = field(default_factory=_empty_types)
+    """(N,) uint8 array of edge types."""
+
+    def __len__(self) -> int:
+        return len(self.etype)
 
     @property
     def is_closed(self) -> bool:
-        if not self.edges:
+        if not len(self):
             return False
-        return bool(self.edges[0].verts[0] == self.edges[-1].verts[-1])
+        return bool(np.array_equal(self.v0[0], self.v1[-1]))
+
+    def points(self) -> np.ndarray:
+        """Return the (M, 2) array of points along the edges.
+
+        The start point of an edge is skipped when it is the same as the end
+        point of the previous edge.
+        """
+        num_edges = len(self)
+        if not num_edges:
+            return _empty_points()
+        keep = np.ones(2 * num_edges, dtype=np.bool_)
+        keep[2::2] = np.any(self.v0[1:] != self.v1[:-1], axis=1)
+        interleaved = np.stack((self.v0, self.v1), axis=1).reshape(-1, 2)
+        return interleaved[keep]
 
     def iter_points(self) -> Iterable[Vector2]:
-        last_point: Optional[Vector2] = None
-        for e in self.edges:
-            if e.verts[0] != last_point:
-                yield e.verts[0]
-            yield e.verts[1]
-            last_point = e.verts[1]
+        for point in self.points():
+            yield Vector2(point)
 
     def extend(self, other_mesh: "FlattenedMesh") -> None:
-        self.edges.extend(other_mesh.edges)
+        self.v0 = np.concatenate((self.v0, other_mesh.v0))
+        self.v1 = np.concatenate((self.v1, other_mesh.v1))
+        self.etype = np.concatenate((self.etype, other_mesh.etype))
 
-    def append_edge(self, edge: "FlattenedEdge") -> None:
-        self.edges.append(edge)
+    @classmethod
+    def concat(cls, meshes: Iterable["FlattenedMesh"]) -> "FlattenedMesh":
+        """Return a mesh with the edges of all meshes, in order.
 
-    def split(self) -> dict[MeshType, list["FlattenedMesh"]]:
-        """Split the mesh into meshes of continues edges of the same type."""
+        Use this instead of repeated `extend()` calls, which copy all edges
+        gathered so far on every call.
+        """
+        meshes = list(meshes)
+        if not meshes:
+            return cls()
+        return cls(
+            v0=np.concatenate([mesh.v0 for mesh in meshes]),
+            v1=np.concatenate([mesh.v1 for mesh in meshes]),
+            etype=np.concatenate([mesh.etype for mesh in meshes]),
+        )
 
-        per_type: dict[MeshType, list[FlattenedMesh]] = defaultdict(list)
+    def split(
+        self, offset: Optional[Vector2] = None
+    ) -> dict[MeshType, list["FlattenedMesh"]]:
+        """Split the mesh into meshes of continues edges of the same type.
 
-        for edge in self.edges:
-            meshes_for_type = per_type[edge.edgeType]
+        If an offset is given, the resulting meshes are translated by it. This
+        saves a separate pass over all the edges to translate them.
+        """
 
-            # Find/create a mesh that this edge can be appended to.
-            for mesh in sorted(meshes_for_type, key=lambda m: -len(m.edges)):
-                if not mesh.edges:
-                    break
-                if edge.follows(mesh.edges[-1]):
-                    break
+        per_type: dict[MeshType, list[FlattenedMesh]] = defaultdict(list)
+        num_edges = len(self)
+        if not num_edges:
+            return per_type
+
+        # Plain Python tuples of (type, x, y), as those are cheap to hash and
+        # compare. Coordinates are rounded to 6 decimals, so that endpoints
+        # that differ only by float noise still connect.
+        etypes = self.etype.tolist()
+        heads = np.round(self.v0.astype(np.float64), 6).tolist()
+        tails = np.round(self.v1.astype(np.float64), 6).tolist()
+
+        # Index the groups of edges by the (type, x, y) of their last point, so
+        # that each edge finds the group it continues with a single lookup.
+        edge_groups = np.empty(num_edges, dtype=np.intp)
+        group_sizes: list[int] = []
+        group_types: list[int] = []
+        tail_index: dict[tuple[int, float, float], list[int]] = {}
+        for edge_idx, (etype, head, tail) in enumerate(zip(etypes, heads, tails)):
+            candidates = tail_index.get((etype, *head))
+            if candidates:
+                # When several groups end here, continue the longest one, and
+                # the earliest created one of those, like the old linear search.
+                group_idx = max(candidates, key=lambda g: (group_sizes[g], -g))
+                candidates.remove(group_idx)
             else:
-                mesh = FlattenedMesh(edges=[])
-                per_type[edge.edgeType].append(mesh)
-
-            mesh.append_edge(edge)
+                group_idx = len(group_sizes)
+                group_sizes.append(0)
+                group_types.append(etype)
+            group_sizes[group_idx] += 1
+            edge_groups[edge_idx] = group_idx
+            tail_index.setdefault((etype, *tail), []).append(group_idx)
+
+        # A stable sort keeps the edges of each group in their original order.
+        order = np.argsort(edge_groups, kind="stable")
+        group_ends = np.cumsum(group_sizes).tolist()
+        group_starts = [0] + group_ends[:-1]
+
+        offset_arr = None if offset is None else np.asarray(offset, dtype=np.float32)
+        for start, end, etype in zip(group_starts, group_ends, group_types):
+            indices = order[start:end]
+            v0 = self.v0[indices]
+            v1 = self.v1[indices]
+            if offset_arr is not None:
+                v0 = v0 + offset_arr
+                v1 = v1 + offset_arr
+            mesh = FlattenedMesh(v0=v0, v1=v1, etype=self.etype[indices])
+            per_type[MeshType.from_int(etype)].append(mesh)
 
         return per_type
 
     def aabb(self) -> "AABB":
-        aabb = AABB()
-        for edge in self.edges:
-            for point in edge.verts:
-                aabb.extend(point)
-        return aabb
+        return AABB.from_points(np.concatenate((self.v0, self.v1)))
 
     def translate_self(self, offset: Vector2) -> None:
-        for edge in self.edges:
-            edge.translate_self(offset)
+        offset_arr = np.asarray(offset, dtype=np.float32)
+        self.v0 += offset_arr
+        self.v1 += offset_arr
 
     def copy(self) -> "FlattenedMesh":
-        return FlattenedMesh(edges=self.edges[:])
+        return FlattenedMesh(
+            v0=self.v0.copy(), v1=self.v1.copy(), etype=self.etype.copy()
+        )
 
     def move_to_origin(self) -> None:
         """Translate this mesh so its smallest coordinate is at the origin."""
@@ -173,21 +291,6 @@ class FlattenedMesh:
         self.translate_self(-aabb.min_point)
 
 
-@dataclass
-class FlattenedEdge:
-    verts: tuple[Vector2, Vector2]
-    edgeType: MeshType
-
-    def follows(self, edge: "FlattenedEdge") -> bool:
-        """Returns whether this edge's start is connected to the given edge's end."""
-        return edge.edgeType == self.edgeType and edge.verts[1] == self.verts[0]
-
-    def translate_self(self, offset: Vector2) -> None:
-        v0 = self.verts[0] + offset
-        v1 = self.verts[1] + offset
-        self.verts = (v0, v1)
-
-
 class MeshBoundary:
     """2D boundaries of a single mesh's outline and holes."""
 
@@ -220,6 +323,27 @@ class MeshBoundary:
         self._aabb = aabb
         return aabb
 
+    @property
+    def aabb_transformed(self) -> "AABB":
+        """The AABB after applying `rotation` and `translation`.
+
+        This reuses the cached untransformed AABB, so it doesn't have to look
+        at the polygons again.
+        """
+        aabb = self.aabb
+        if self.rotation == 0:
+            return aabb.translated(self.translation)
+
+        # With the Y-axis flip of the SVG export, rotate(90) maps (x, y) to (y, -x).
+        assert self.rotation == 90, f"unexpected rotation {self.rotation}"
+        rotated = AABB(
+            min_x=aabb.min_y,
+            min_y=-aabb.max_x,
+            max_x=aabb.max_y,
+            max_y=-aabb.min_x,
+        )
+        return rotated.translated(self.translation)
+
     def transform_into(self, position: Vector2, size: Vector2) -> None:
         """Rotate the shape to a new position and rotate to make the size match.
 
@@ -292,6 +416,21 @@ class AABB:
         """Area spanned by the AABB."""
         return self.width * self.height
 
+    @classmethod
+    def from_points(cls, points: np.ndarray) -> "AABB":
+        """Construct the AABB of an (N, 2) array of points.
+
+        Use this instead of calling `extend()` for each point.
+
+        >>> AABB.from_points(np.array([[1, 2], [3, 0.5]]))
+        AABB(min_x=1.0, min_y=0.5, max_x=3.0, max_y=2.0)
+        """
+        if not len(points):
+            return cls()
+        min_x, min_y = points.min(axis=0).astype(np.float64).tolist()
+        max_x, max_y = points.max(axis=0).astype(np.float64).tolist()
+        return cls(min_x=min_x, min_y=min_y, max_x=max_x, max_y=max_y)
+
     def extend(self, point: Vector2) -> None:
         """Extend the AABB to include the given point."""
         self.min_x = min(self.min_x, point[0])
@@ -364,18 +503,19 @@ def flatten_mesh(object: bpy.types.Object, options: Options) -> MeshBoundary:
     """
     assert object.type == "MESH"
 
-    combined_flat_mesh = FlattenedMesh(edges=[])
+    flat_meshes: list[FlattenedMesh] = []
+    aabb = AABB()
     with _mesh_to_bmesh(object) as bm:
         drop_axis = _axis_to_drop(bm)
         for annotated_mesh in _find_boundary_polys(bm, options, object.name):
             flat_mesh = annotated_mesh.flattened(drop_axis)
-            combined_flat_mesh.extend(flat_mesh)
-
-    combined_flat_mesh.move_to_origin()
-    split = combined_flat_mesh.split()
-    from pprint import pprint
+            aabb.join(flat_mesh.aabb())
+            flat_meshes.append(flat_mesh)
+    combined_flat_mesh = FlattenedMesh.concat(flat_meshes)
 
-    pprint(split)
+    # Move to the origin while splitting, instead of in a separate pass.
+    split = combined_flat_mesh.split(offset=-aabb.min_point)
+    logger.debug("split=%s", split)
 
     mesh_boundary = MeshBoundary(object.name)
     mesh_boundary.polygons = split
@@ -400,7 +540,11 @@ def _find_boundary_polys(
 def add_kerf(bm: bmesh.types.BMesh, options: Options, object_name: str) -> None:
     """Add a kerf offset to all edges except ones marked as "seam" or "sharp"."""
 
-    edge_kerfs = defaultdict(list)
+    # Collect the loops along the boundary, as parallel lists of indices.
+    loop_vert_indices: list[int] = []
+    other_vert_indices: list[int] = []
+    edge_indices: list[int] = []
+    face_normals: list[Vector3] = []
 
     for v in bm.verts:
         if not v.is_boundary:
@@ -413,35 +557,50 @@ def add_kerf(bm: bmesh.types.BMesh, options: Options, object_name: str) -> None:
             if e.seam:  # Seams are used as "do not apply kerf compensation".
                 continue
 
-            # Assumption: face lies to the left of the loop.
-            v_other = e.other_vert(v)
-            loop_vec = (v_other.co - v.co).normalized()
-            tangent = loop_vec.cross(l.face.normal).normalized()
-            if abs(tangent.length - 1.0) > 1e-6:
-                raise MeshAnalysisError(
-                    f"{object_name}: loop tangent is not unit length: {tangent}"
-                )
-            edge_kerfs[e.index].append(tangent)
+            loop_vert_indices.append(v.index)
+            other_vert_indices.append(e.other_vert(v).index)
+            edge_indices.append(e.index)
+            face_normals.append(l.face.normal)
+
+    if not edge_indices:
+        return
+    assert len(set(edge_indices)) == len(edge_indices), "Expecting edges to be visited only once"
+
+    # Compute all the tangents in one go.
+    co = _bmesh_coords(bm).astype(np.float64)
+    loop_verts = np.array(loop_vert_indices)
+    other_verts = np.array(other_vert_indices)
+    normals = np.array(face_normals, dtype=np.float64).reshape(-1, 3)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Assumption: face lies to the left of the loop.
+        loop_vecs = co[other_verts] - co[loop_verts]
+        loop_vecs /= np.linalg.norm(loop_vecs, axis=1, keepdims=True)
+        tangents = np.cross(loop_vecs, normals)
+        tangents /= np.linalg.norm(tangents, axis=1, keepdims=True)
+
+    # Written as a negation so that NaNs from degenerate loops are caught too.
+    not_unit = ~(np.abs(np.linalg.norm(tangents, axis=1) - 1.0) <= 1e-6)
+    if not_unit.any():
+        tangent = tangents[np.argmax(not_unit)]
+        raise MeshAnalysisError(
+            f"{object_name}: loop tangent is not unit length: {Vector(tangent)}"
+        )
 
     # Accumulate kerfs. This must be done afterwards to ensure all kerf
     # directions are computed before the adjustments are applied.
-    vtx_kerf_directions: dict[int, Vector] = defaultdict(
-        lambda: Vector((0, 0, 0)))
-    for edge_index, kerfs in edge_kerfs.items():
-        assert len(kerfs) == 1, "Expecting edges to be visited only once"
-        kerf_direction = kerfs[0]
+    vtx_kerf_directions = np.zeros_like(co)
+    np.add.at(vtx_kerf_directions, loop_verts, tangents)
+    np.add.at(vtx_kerf_directions, other_verts, tangents)
 
-        e = bm.edges[edge_index]
-        for v in e.verts:
-            vtx_kerf_directions[v.index] += kerf_direction
+    # Clamping prevents applying the kerf multiple times in the same direction.
+    np.clip(vtx_kerf_directions, -1.0, 1.0, out=vtx_kerf_directions)
+    vtx_kerf_directions *= options.laser_width / 2
 
     bm.verts.ensure_lookup_table()
-    kerf_width = options.laser_width / 2
-    for vtx_index, kerf_direction in vtx_kerf_directions.items():
-        # Clamping prevents applying the kerf multiple times in the same direction.
-        clamp_vector(kerf_direction)
+    for vtx_index in np.unique(np.concatenate((loop_verts, other_verts))).tolist():
         v = bm.verts[vtx_index]
-        v.co += kerf_direction * kerf_width
+        v.co += Vector(vtx_kerf_directions[vtx_index])
 
 
 def _boundary_polygons_from_bmesh(
@@ -453,108 +612,268 @@ def _boundary_polygons_from_bmesh(
     `(start, end)` tuple of their coordinates. For connected edges, the `end` of
     edge N is the same as `start` of edge N+1.
     """
+    bm.verts.index_update()
     bm.edges.index_update()
 
-    export_edge_indices = {e.index for e in bm.edges if _is_export_edge(e)}
-    start_edge_indices = _find_start_edge_indices(bm)
+    num_verts = len(bm.verts)
+    num_edges = len(bm.edges)
 
-    non_export_starters = start_edge_indices - export_edge_indices
-    if non_export_starters:
-        print(
-            f"Warning: non-export started edges: {sorted(non_export_starters)}")
-        start_edge_indices -= non_export_starters
+    export_mask = np.fromiter(
+        (_is_export_edge(e) for e in bm.edges), dtype=np.bool_, count=num_edges
+    )
+
+    # Vertex/edge connectivity, as arrays the chain walker can use.
+    edge_verts = bmesh_edge_verts(bm)
+    vert_degree, adj_offsets, adj_edges = _vertex_adjacency(edge_verts, num_verts)
 
-    def find_next_edge(vertex: bmesh.types.BMVert) -> Optional[bmesh.types.BMEdge]:
-        for e in vertex.link_edges:
-            if e.index in export_edge_indices:
-                return e
-        return None
+    start_mask = np.zeros(num_edges, dtype=np.bool_)
+    start_mask[_find_start_edge_indices(vert_degree, adj_offsets, adj_edges)] = True
 
-    while export_edge_indices:
+    non_export_starters = start_mask & ~export_mask
+    if non_export_starters.any():
+        print(
+            f"Warning: non-export started edges: {np.flatnonzero(non_export_starters).tolist()}")
+        start_mask &= export_mask
+
+    # Determine the type of each edge once, instead of every time it's visited.
+    edge_is_smooth = np.fromiter(
+        (e.smooth for e in bm.edges), dtype=np.bool_, count=num_edges
+    )
+    edge_types = np.where(edge_is_smooth, _CUT, _ENGRAVE).astype(np.uint8)
+
+    edge_order, edge_flipped, chain_offsets = _walk_chains(
+        export_mask, start_mask, edge_verts, vert_degree, adj_offsets, adj_edges
+    )
+
+    # Only now go back to BMesh to construct the annotated meshes.
+    edge_order_list = edge_order.tolist()
+    edge_flipped_list = edge_flipped.tolist()
+    edge_types_list = edge_types.tolist()
+    chain_offsets_list = chain_offsets.tolist()
+    for chain_start, chain_end in zip(chain_offsets_list[:-1], chain_offsets_list[1:]):
         annotated_mesh = AnnotatedMesh(edges=[])
+        for out_idx in range(chain_start, chain_end):
+            edge_idx = edge_order_list[out_idx]
+            start_vert, end_vert = bm.edges[edge_idx].verts
+            if edge_flipped_list[out_idx]:
+                start_vert, end_vert = end_vert, start_vert
+            edge = AnnotatedEdge(verts=(start_vert.co, end_vert.co),
+                                 edgeType=MeshType.from_int(edge_types_list[edge_idx]))
+            annotated_mesh.append_edge(edge)
+        yield annotated_mesh
 
-        # Find the next edge to export.
-        if start_edge_indices:
-            edge_idx = start_edge_indices.pop()
-            export_edge_indices.remove(edge_idx)
+
+def _vertex_adjacency(
+    edge_verts: np.ndarray, num_verts: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute vertex degrees and the vertex-to-edge adjacency in CSR form.
+
+    The edges incident to vertex `v` are `adj_edges[adj_offsets[v]:adj_offsets[v+1]]`.
+
+    Returns a `(vert_degree, adj_offsets, adj_edges)` tuple of arrays.
+    """
+    num_edges = len(edge_verts)
+    half_edge_verts = edge_verts.ravel()
+    half_edge_edges = np.repeat(np.arange(num_edges, dtype=np.int32), 2)
+
+    order = np.argsort(half_edge_verts, kind="stable")
+    adj_edges = half_edge_edges[order]
+
+    vert_degree = np.bincount(half_edge_verts, minlength=num_verts).astype(np.int32)
+    adj_offsets = np.zeros(num_verts + 1, dtype=np.int32)
+    np.cumsum(vert_degree, out=adj_offsets[1:])
+
+    return vert_degree, adj_offsets, adj_edges
+
+
+def _walk_chains(
+    export_mask: np.ndarray,
+    start_mask: np.ndarray,
+    edge_verts: np.ndarray,
+    vert_degree: np.ndarray,
+    adj_offsets: np.ndarray,
+    adj_edges: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Follow the export edges into chains of connected edges.
+
+    This only works on arrays, so that it can be compiled with Numba when that
+    is available. `export_mask` is modified in place.
+
+    Returns a `(edge_order, edge_flipped, chain_offsets)` tuple of arrays.
+    Chain `i` consists of the edges `edge_order[chain_offsets[i]:chain_offsets[i+1]]`,
+    where `edge_flipped` indicates the edge runs from its 2nd to its 1st vertex.
+    """
+    num_edges = edge_verts.shape[0]
+    edge_order = np.empty(num_edges, dtype=np.int32)
+    edge_flipped = np.zeros(num_edges, dtype=np.bool_)
+    chain_offsets = np.zeros(num_edges + 1, dtype=np.int32)
+
+    remaining = 0
+    for edge_idx in range(num_edges):
+        if export_mask[edge_idx]:
+            remaining += 1
+
+    num_out = 0
+    num_chains = 0
+    next_start = 0
+    next_any = 0
+    while remaining > 0:
+        # Find the next edge to export, preferring the ends of chains.
+        while next_start < num_edges and not (
+            start_mask[next_start] and export_mask[next_start]
+        ):
+            next_start += 1
+        if next_start < num_edges:
+            edge_idx = next_start
         else:
-            edge_idx = export_edge_indices.pop()
+            while not export_mask[next_any]:
+                next_any += 1
+            edge_idx = next_any
+        export_mask[edge_idx] = False
+        remaining -= 1
 
-        e = bm.edges[edge_idx]
+        chain_offsets[num_chains] = num_out
+        num_chains += 1
 
         # If one of the vertices is only incident to this edge, start there.
-        if len(e.verts[0].link_edges) == 1:
-            v0, visit = e.verts
+        if vert_degree[edge_verts[edge_idx, 0]] == 1:
+            v0 = edge_verts[edge_idx, 0]
+            visit = edge_verts[edge_idx, 1]
+            flipped = False
         else:
-            visit, v0 = e.verts
-
-        edge = AnnotatedEdge(verts=(v0.co, visit.co),
-                             edgeType=MeshType.for_edge(e))
-        annotated_mesh.append_edge(edge)
+            v0 = edge_verts[edge_idx, 1]
+            visit = edge_verts[edge_idx, 0]
+            flipped = True
+        edge_order[num_out] = edge_idx
+        edge_flipped[num_out] = flipped
+        num_out += 1
 
         # Keep following this edge sequence until the end.
-        while visit.index != v0.index:
-            e = find_next_edge(visit)
-            if e is None:
+        while visit != v0:
+            edge_idx = -1
+            for adj_idx in range(adj_offsets[visit], adj_offsets[visit + 1]):
+                if export_mask[adj_edges[adj_idx]]:
+                    edge_idx = adj_edges[adj_idx]
+                    break
+            if edge_idx < 0:
                 break
-            export_edge_indices.remove(e.index)
-            start_edge_indices.discard(e.index)
-
-            edge_type = MeshType.for_edge(e)
+            export_mask[edge_idx] = False
+            remaining -= 1
 
             # Vertices of the edges are not guaranteed in the same order.
-            # Find the one that is not the current v1.
-            next1, next2 = e.verts
-            if next1.index == visit.index:
-                visit = next2
-                edge = AnnotatedEdge(
-                    verts=(next1.co, visit.co), edgeType=edge_type)
+            # Find the one that is not the current one.
+            if edge_verts[edge_idx, 0] == visit:
+                visit = edge_verts[edge_idx, 1]
+                flipped = False
             else:
-                visit = next1
-                edge = AnnotatedEdge(
-                    verts=(next2.co, visit.co), edgeType=edge_type)
-            annotated_mesh.append_edge(edge)
+                visit = edge_verts[edge_idx, 0]
+                flipped = True
+            edge_order[num_out] = edge_idx
+            edge_flipped[num_out] = flipped
+            num_out += 1
+
+    chain_offsets[num_chains] = num_out
+    return edge_order[:num_out], edge_flipped[:num_out], chain_offsets[: num_chains + 1]
 
-        yield annotated_mesh
 
+if njit is not None:
+    _walk_chains = njit(cache=True)(_walk_chains)
 
-def _find_start_edge_indices(bm: bmesh.types.BMesh) -> set[int]:
-    """Return a set of edge indices to start exporting from.
+
+def island_roots(edge_verts: np.ndarray, num_verts: int) -> np.ndarray:
+    """Return, for each vertex, a representative vertex of its island.
+
+    Islands are the connected components of the edges; two vertices are in
+    the same island if and only if they get the same representative. This is
+    a union-find with path halving, written as plain loops so that Numba can
+    compile it.
+
+    >>> island_roots(np.array([[0, 1], [2, 3], [3, 1]]), 5).tolist()
+    [2, 2, 2, 2, 4]
+    """
+    parent = np.arange(num_verts, dtype=np.int32)
+
+    for edge_idx in range(edge_verts.shape[0]):
+        root_a = edge_verts[edge_idx, 0]
+        while parent[root_a] != root_a:
+            parent[root_a] = parent[parent[root_a]]
+            root_a = parent[root_a]
+        root_b = edge_verts[edge_idx, 1]
+        while parent[root_b] != root_b:
+            parent[root_b] = parent[parent[root_b]]
+            root_b = parent[root_b]
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    # Point every vertex directly at its root.
+    for vert_idx in range(num_verts):
+        root = vert_idx
+        while parent[root] != root:
+            root = parent[root]
+        parent[vert_idx] = root
+    return parent
+
+
+if njit is not None:
+    island_roots = njit(cache=True)(island_roots)
+
+
+def _find_start_edge_indices(
+    vert_degree: np.ndarray, adj_offsets: np.ndarray, adj_edges: np.ndarray
+) -> np.ndarray:
+    """Return an array of edge indices to start exporting from.
 
     These indices are edges that end the chain of edges, i.e. either their start
-    or end vertex only has one edge.
+    or end vertex only has one edge. The arguments are as returned by
+    `_vertex_adjacency()`.
     """
 
-    edge_indices: set[int] = set()
-    for v in bm.verts:
-        if len(v.link_edges) != 1:
-            continue
-        edge_indices.add(v.link_edges[0].index)
-    return edge_indices
+    leaf_verts = np.flatnonzero(vert_degree == 1)
+    # A leaf vertex has exactly one incident edge, the first in its adjacency list.
+    return np.unique(adj_edges[adj_offsets[leaf_verts]])
 
 
 def _axis_to_drop(bm: bmesh.types.BMesh) -> int:
-    # Compute bounding box. The AABB is only 2D, so keep track of min/max Z separately.
-    min_z = float("inf")
-    max_z = float("-inf")
-    aabb = AABB()
-    for v in bm.verts:
-        aabb.extend(v.co.xy)
-        min_z = min(min_z, v.co.z)
-        max_z = max(max_z, v.co.z)
-
-    bbox_min = Vector((aabb.min_x, aabb.min_y, min_z))
-    bbox_max = Vector((aabb.max_x, aabb.max_y, max_z))
-    bbox_dim = tuple(bbox_max - bbox_min)
+    coords = _bmesh_coords(bm)
+    if not len(coords):
+        return 0
 
-    drop_axis = bbox_dim.index(min(bbox_dim))
+    bbox_dim = coords.max(axis=0) - coords.min(axis=0)
+    drop_axis = int(bbox_dim.argmin())
     return drop_axis
 
 
+def _bmesh_coords(bm: bmesh.types.BMesh) -> np.ndarray:
+    """Return the vertex coordinates of the BMesh as (V, 3) float32 array.
+
+    BMesh sequences have no `foreach_get()`, so this is the cheapest way to get
+    them all in one array.
+    """
+    num_verts = len(bm.verts)
+    flat = np.fromiter(
+        chain.from_iterable(v.co for v in bm.verts),
+        dtype=np.float32,
+        count=3 * num_verts,
+    )
+    return flat.reshape(num_verts, 3)
+
+
+def bmesh_edge_verts(bm: bmesh.types.BMesh) -> np.ndarray:
+    """Return the vertex indices of the BMesh edges as (E, 2) int32 array.
+
+    The vertex indices must be up to date, see `BMVertSeq.index_update()`.
+    """
+    num_edges = len(bm.edges)
+    flat = np.fromiter(
+        chain.from_iterable((e.verts[0].index, e.verts[1].index) for e in bm.edges),
+        dtype=np.int32,
+        count=2 * num_edges,
+    )
+    return flat.reshape(num_edges, 2)
+
+
 def clamp_vector(v: Vector) -> None:
-    v.x = max(-1.0, min(v.x, 1.0))
-    v.y = max(-1.0, min(v.y, 1.0))
-    v.z = max(-1.0, min(v.z, 1.0))
+    v[:] = [max(-1.0, min(c, 1.0)) for c in v]
 
 
 @contextmanager
@@ -571,12 +890,13 @@ def _mesh_to_bmesh(object: bpy.types.Object) -> Iterator[bmesh.types.BMesh]:
         bpy.ops.object.mode_set(mode="OBJECT")
 
     scale_vec = object.matrix_world.to_scale()
-    scale_mat = Matrix.Diagonal(scale_vec)
     bm: bmesh.types.BMesh = bmesh.new()
     me: bpy.types.Mesh = object.data
     try:
         bm.from_mesh(me)
-        bmesh.ops.transform(bm, matrix=scale_mat, verts=bm.verts)
+        # Unscaled objects are common, and need no vertex rewrite at all.
+        if scale_vec != Vector((1.0, 1.0, 1.0)):
+            bm.transform(Matrix.Diagonal(scale_vec).to_4x4())
         yield bm
     finally:
         bm.free()
@@ -599,5 +919,7 @@ def _is_export_edge(e: bmesh.types.BMEdge) -> bool:
     return bool(e.is_boundary or e.is_wire)
 
 
-mod = sys.modules[__name__]
-doctest.testmod(mod)
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -11,24 +11,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import logging
+from itertools import compress
 from pathlib import Path
-from collections import defaultdict
 
 import bpy
 import bmesh
+import numpy as np
 from bpy_extras.io_utils import ExportHelper
-from mathutils import Vector
 
 
-is_first_load = "svg_export" not in locals()
-if is_first_load:
-    from . import svg_export, mesh_analysis  # , straightener
-else:
-    import importlib
+from . import svg_export, mesh_analysis  # , straightener
 
-    svg_export = importlib.reload(svg_export)
-    mesh_analysis = importlib.reload(mesh_analysis)
-    # straightener = importlib.reload(straightener)
+
+logger = logging.getLogger(__name__)
+
+
+def _prefs(context: bpy.types.Context) -> bpy.types.AddonPreferences:
+    return context.preferences.addons[__package__].preferences
+
+
+def _foreach_get(
+    seq: bpy.types.bpy_prop_collection, attr: str, dtype: type, width: int = 1
+) -> np.ndarray:
+    """Return `attr` of all items in `seq` as flat array.
+
+    `dtype` must match the DNA type of the property (np.float32 for floats,
+    np.int32 for ints, np.bool_ for booleans); otherwise Blender falls back to
+    converting element by element.
+    """
+    buf = np.empty(width * len(seq), dtype=dtype)
+    seq.foreach_get(attr, buf)
+    return buf
 
 
 class EXPORT_MESH_OT_lasercut_svg_export(bpy.types.Operator, ExportHelper):
@@ -46,6 +60,14 @@ class EXPORT_MESH_OT_lasercut_svg_export(bpy.types.Operator, ExportHelper):
         name="Shape Table",
         description="Include a table listing the shapes and their sizes",
     )
+    svg_precision: bpy.props.IntProperty(  # type:ignore
+        name="Precision",
+        description="Number of decimals for coordinates in the SVG file. "
+        "Fewer decimals give smaller files",
+        default=3,
+        min=0,
+        max=6,
+    )
 
     def execute(self, context: bpy.types.Context) -> set[str]:
         depsgraph = context.view_layer.depsgraph
@@ -61,6 +83,7 @@ class EXPORT_MESH_OT_lasercut_svg_export(bpy.types.Operator, ExportHelper):
             pack_sort=scene.lasercut_svg_export_pack_sort,
             pack_may_rotate=scene.lasercut_svg_export_pack_may_rotate,
             shape_table=self.export_shape_table,
+            svg_precision=self.svg_precision,
         )
         filepath = Path(self.filepath)
         try:
@@ -75,8 +98,7 @@ class EXPORT_MESH_OT_lasercut_svg_export(bpy.types.Operator, ExportHelper):
                 canvas_size[1]} mm SVG file"
         )
 
-        prefs = context.preferences.addons[__package__].preferences
-        if prefs.open_dir_after_export:
+        if _prefs(context).open_dir_after_export:
             bpy.ops.wm.path_open(filepath=str(filepath.parent))
 
         return {"FINISHED"}
@@ -136,10 +158,7 @@ class LASERCUTSVGEXPORT_OT_scale_scene(bpy.types.Operator):
         # Remove the default Cube if exists
         removed_cube = False
         if 'Cube' in bpy.data.objects:
-            default_cube = bpy.data.objects['Cube']
-            bpy.ops.object.select_all(action='DESELECT')
-            default_cube.select_set(True)
-            bpy.ops.object.delete(use_global=False)
+            bpy.data.objects.remove(bpy.data.objects['Cube'], do_unlink=True)
             removed_cube = True
 
         # Add a 100*100mm plane if not already there and if we just removed the default cube or if there were any meshes at all
@@ -147,52 +166,53 @@ class LASERCUTSVGEXPORT_OT_scale_scene(bpy.types.Operator):
             bpy.ops.mesh.primitive_plane_add(
                 size=100, enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
             # set this new 'Plane' as active object to exclude a potential now invalid (removed) 'Cube' as active
-            context.view_layer.objects.active = bpy.data.objects['Plane']
-            bpy.ops.lasercut_svg_export.add_solidify()
-
-        bpy.ops.object.select_all(action='DESELECT')
-
-        # Select and configure default Camera to not clip before 2 meters far
-        if 'Camera' in bpy.data.objects:
-            default_camera = bpy.data.objects['Camera']
+            plane = bpy.data.objects['Plane']
+            context.view_layer.objects.active = plane
+            # Same as the add_solidify operator, without the operator overhead.
+            LASERCUTSVGEXPORT_OT_add_solidify.add_modifier(context, plane)
+
+        self._deselect_all(context)
+
+        # Select and configure default Camera to not clip before 2 meters far.
+        # Don't scale (nor configure) more than once: the initial scale length is
+        # sqrt(3) ~= 1.71, so a longer one means it was done already.
+        default_camera = bpy.data.objects.get('Camera')
+        if default_camera and default_camera.scale.length <= 2:
+            default_camera.data.clip_start = 20
+            default_camera.data.clip_end = 2000
             default_camera.select_set(True)
             context.view_layer.objects.active = default_camera
-            context.object.data.clip_start = 20
-            context.object.data.clip_end = 2000
-            if context.object.scale.length > 2:
-                # Don't scale more than once (initial is srqt(3) ~= 1.71)
-                default_camera.select_set(False)
 
         # Select and configure default Light to 1 Watt
-        if 'Light' in bpy.data.objects:
-            default_light = bpy.data.objects['Light']
+        default_light = bpy.data.objects.get('Light')
+        if default_light and default_light.scale.length <= 2:
+            default_light.data.energy = 1e+06
             default_light.select_set(True)
             context.view_layer.objects.active = default_light
-            context.object.data.energy = 1e+06
-            if context.object.scale.length > 2:
-                # Don't scale more than once (initial is srqt(3) ~= 1.71)
-                default_light.select_set(False)
 
         # Scale by 50 from Global center selected objects (maybe Camera and Light)
         if context.selected_objects:
             bpy.ops.view3d.snap_cursor_to_center()
             context.scene.tool_settings.transform_pivot_point = 'CURSOR'
             bpy.ops.transform.resize(value=(50, 50, 50), orient_type='GLOBAL')
-            bpy.ops.object.select_all(action='DESELECT')
+            self._deselect_all(context)
 
-            # Unzoom all 3D views
+            # Unzoom all 3D views by the same factor, by setting their view
+            # distance directly rather than stepping the zoom operator.
             for area in context.screen.areas:
                 if area.type == 'VIEW_3D':
-                    for region in area.regions:
-                        if region.type == 'WINDOW':
-                            # XXX can't make it unzoom more than one step, even with delta=-1000
-                            for i in range(20):
-                                bpy.ops.view3d.zoom(delta=-1)
+                    area.spaces.active.region_3d.view_distance *= 50
 
         context.scene.tool_settings.transform_pivot_point = old_pivot_point
 
         return {"FINISHED"}
 
+    @staticmethod
+    def _deselect_all(context: bpy.types.Context) -> None:
+        # Cheaper than the select_all operator, and only touches what's selected.
+        for ob in context.selected_objects:
+            ob.select_set(False)
+
 
 class LASERCUTSVGEXPORT_OT_add_solidify(bpy.types.Operator):
     bl_idname = "lasercut_svg_export.add_solidify"
@@ -214,7 +234,8 @@ class LASERCUTSVGEXPORT_OT_add_solidify(bpy.types.Operator):
             self.add_modifier(context, ob)
         return {"FINISHED"}
 
-    def add_modifier(self, context: bpy.types.Context, ob: bpy.types.Object) -> None:
+    @classmethod
+    def add_modifier(cls, context: bpy.types.Context, ob: bpy.types.Object) -> None:
         mod = ob.modifiers.new("Solidify", "SOLIDIFY")
         mod.thickness = 0.001
         mod.offset = 1.0
@@ -228,7 +249,13 @@ class LASERCUTSVGEXPORT_OT_add_solidify(bpy.types.Operator):
         mod.show_in_editmode = False
 
         driver_rna_path = f'modifiers["{mod.name}"].thickness'
-        ob.driver_remove(driver_rna_path)  # prevent double drivers
+        anim_data = ob.animation_data
+        fcurve = anim_data and anim_data.drivers.find(driver_rna_path)
+        if fcurve:
+            # A driver left over from a removed modifier of the same name.
+            if cls._drives_thickness(fcurve.driver, context.scene):
+                return
+            ob.driver_remove(driver_rna_path)  # prevent double drivers
         fcurve = ob.driver_add(driver_rna_path)
         driver = fcurve.driver
         driver.expression = "thickness"
@@ -239,6 +266,20 @@ class LASERCUTSVGEXPORT_OT_add_solidify(bpy.types.Operator):
         dvar.targets[0].id = context.scene
         dvar.targets[0].data_path = f"lasercut_svg_export_material_thickness"
 
+    @staticmethod
+    def _drives_thickness(driver: bpy.types.Driver, scene: bpy.types.Scene) -> bool:
+        """Return whether the driver is already set up by add_modifier()."""
+        if driver.expression != "thickness" or len(driver.variables) != 1:
+            return False
+        dvar = driver.variables[0]
+        target = dvar.targets[0]
+        return (
+            dvar.name == "thickness"
+            and dvar.type == "SINGLE_PROP"
+            and target.id == scene
+            and target.data_path == "lasercut_svg_export_material_thickness"
+        )
+
 
 class LASERCUTSVGEXPORT_OT_select_export_edges(bpy.types.Operator):
     bl_idname = "lasercut_svg_export.select_export_edges"
@@ -283,25 +324,44 @@ class LASERCUTSVGEXPORT_OT_island_faces(bpy.types.Operator):
         return {"FINISHED"}
 
     def make_islands(self, mesh: bpy.types.Mesh) -> None:
-        vertex_indices = set(range(0, len(mesh.vertices)))
-
-        while vertex_indices:
-            bpy.ops.mesh.select_mode(type="VERT")
-            bpy.ops.mesh.select_all(action="DESELECT")
+        bm = bmesh.from_edit_mesh(mesh)
+        bm.verts.index_update()
+        bm.edges.ensure_lookup_table()
 
-            bpy.ops.object.mode_set(mode="OBJECT")
-            for loop in mesh.loops:
-                vertex_indices.discard(loop.vertex_index)
+        # Find the connected islands.
+        edge_verts = mesh_analysis.bmesh_edge_verts(bm)
+        vert_roots = mesh_analysis.island_roots(edge_verts, len(bm.verts))
 
-            if not vertex_indices:
-                break
+        # Only islands that have a vertex without any face need filling.
+        unfaced = np.fromiter(
+            (not v.link_loops for v in bm.verts), dtype=np.bool_, count=len(bm.verts)
+        )
+        unfaced_roots = np.unique(vert_roots[unfaced])
+        if not len(unfaced_roots):
+            return
+
+        # Group the edges of those islands, before adding any geometry
+        # invalidates the edge lookup table.
+        edge_roots = vert_roots[edge_verts[:, 0]]
+        fill_edges = np.flatnonzero(np.isin(edge_roots, unfaced_roots))
+        fill_edges = fill_edges[np.argsort(edge_roots[fill_edges], kind="stable")]
+        island_bounds = np.flatnonzero(np.diff(edge_roots[fill_edges])) + 1
+        islands = [
+            [bm.edges[idx] for idx in edge_indices]
+            for edge_indices in np.split(fill_edges, island_bounds)
+            if len(edge_indices)
+        ]
 
-            unconnected_idx = vertex_indices.pop()
-            mesh.vertices[unconnected_idx].select = True
+        for edges in islands:
+            verts = {v for edge in edges for v in edge.verts}
+            for vert in verts:
+                vert.select = True
+            # This is what the 'mesh.edge_face_add' operator does, minus the
+            # operator overhead.
+            bmesh.ops.contextual_create(bm, geom=[*verts, *edges])
 
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_linked()
-            bpy.ops.mesh.edge_face_add()
+        bm.select_flush(True)
+        bmesh.update_edit_mesh(mesh)
 
 
 class LASERCUTSVGEXPORT_OT_separate_mesh(bpy.types.Operator):
@@ -318,51 +378,81 @@ class LASERCUTSVGEXPORT_OT_separate_mesh(bpy.types.Operator):
 
     def execute(self, context: bpy.types.Context) -> set[str]:
         mesh = context.edit_object.data
-        print("Splitting mesh:")
-        while self.split_step(mesh):
-            pass
-        return {"FINISHED"}
-
-    def split_step(self, mesh: bpy.types.Mesh) -> bool:
-        face_indices_per_normal = defaultdict(set)
-
-        # Group faces by their normal.
-        for idx, normal in enumerate(mesh.polygon_normals):
-            vec = Vector(
-                (
-                    round(normal.vector.x, 4),
-                    round(normal.vector.y, 4),
-                    round(normal.vector.z, 4),
-                )
-            ).freeze()
+        logger.debug("Splitting mesh %s", mesh.name)
+        # Leaving edit mode writes the edit data back to the mesh, so the
+        # normals read from it are up to date.
+        bpy.ops.object.mode_set(mode="OBJECT")
+        normal_keys = self.normal_keys(mesh)
+        has_loose = self.has_loose_geometry(mesh)
+        bpy.ops.object.mode_set(mode="EDIT")
 
-            face_indices_per_normal[vec].add(idx)
+        unique_keys, face_groups = np.unique(normal_keys, return_inverse=True)
+        all_unique = len(unique_keys) > 1 and len(unique_keys) == len(normal_keys)
+        if all_unique and not has_loose:
+            # Every face is its own group, so instead of separating them one by
+            # one, disconnect all faces and separate them in one go. Loose
+            # edges and vertices would each become an object of their own
+            # that way, so then the per-group separation below is used, which
+            # keeps them with the remaining mesh.
+            bpy.ops.mesh.select_all(action="SELECT")
+            bpy.ops.mesh.edge_split(type="EDGE")
+            bpy.ops.mesh.separate(type="LOOSE")
+            return {"FINISHED"}
+
+        # Let's not split off the final group.
+        for group in range(len(unique_keys) - 1):
+            face_groups = self.split_step(mesh, face_groups, group)
+            if face_groups is None:
+                self.report({"WARNING"}, "Mesh changed unexpectedly, stopped splitting")
+                break
+        return {"FINISHED"}
 
-        if len(face_indices_per_normal) < 2:
-            # Let's not split off the final group.
-            return False
+    @staticmethod
+    def normal_keys(mesh: bpy.types.Mesh) -> np.ndarray:
+        """Return an int64 key per face, equal for faces with the same normal.
+
+        Normals are rounded to 4 decimals. The components are then in [-10000,
+        10000], so they can be packed into a single key; grouping 1D keys is
+        much cheaper than np.unique(axis=0).
+        """
+        normals = _foreach_get(mesh.polygon_normals, "vector", np.float32, width=3)
+        quantized = np.rint(normals.reshape(-1, 3) * 1e4).astype(np.int64)
+        quantized += 10000
+        return (quantized[:, 2] * 20001 + quantized[:, 1]) * 20001 + quantized[:, 0]
 
-        # Split off the first group. After this, the face indices are all
-        # changed anyway, so the entire analysis has to be done from scratch.
-        vec, face_indices = face_indices_per_normal.popitem()
+    @staticmethod
+    def has_loose_geometry(mesh: bpy.types.Mesh) -> bool:
+        """Return whether the mesh has edges or vertices that are not part of a face."""
+        edge_used = np.zeros(len(mesh.edges), dtype=np.bool_)
+        edge_used[_foreach_get(mesh.loops, "edge_index", np.int32)] = True
+        vert_used = np.zeros(len(mesh.vertices), dtype=np.bool_)
+        vert_used[_foreach_get(mesh.loops, "vertex_index", np.int32)] = True
+        return not (edge_used.all() and vert_used.all())
+
+    def split_step(
+        self, mesh: bpy.types.Mesh, face_groups: np.ndarray, group: int
+    ) -> np.ndarray | None:
+        """Separate the faces of one normal group into a new object.
+
+        Works in edit mode, on the edit BMesh, so no mode switches are needed
+        between steps. Returns the groups of the faces that remain; separating
+        keeps those in order, so they don't have to be computed again. Returns
+        None if the face count shows that assumption no longer holds.
+        """
+        bm = bmesh.from_edit_mesh(mesh)
+        if len(bm.faces) != len(face_groups):
+            return None
+        face_select = face_groups == group
 
-        # Select the faces in the group:
         bpy.ops.mesh.select_all(action="DESELECT")
-        bm = bmesh.from_edit_mesh(mesh)
-        bm.faces.ensure_lookup_table()  # Necessary after the first split.
-        for idx in face_indices:
-            face = bm.faces[idx]
-            face.select = True
-        bm.select_flush(True)
-        bmesh.update_edit_mesh(mesh)
+        # Walk the faces in order, rather than building a lookup table for
+        # random access after every split.
+        for face in compress(bm.faces, face_select.tolist()):
+            face.select_set(True)
+        bmesh.update_edit_mesh(mesh, loop_triangles=False, destructive=False)
 
         bpy.ops.mesh.separate(type="SELECTED")
-
-        # Toggle edit mode back & forth to ensure edit data is up to date.
-        bpy.ops.object.mode_set(mode="OBJECT")
-        bpy.ops.object.mode_set(mode="EDIT")
-
-        return True
+        return face_groups[~face_select]
 
 
 class LASERCUTSVGEXPORT_OT_boolean_cut(bpy.types.Operator):
@@ -375,11 +465,11 @@ class LASERCUTSVGEXPORT_OT_boolean_cut(bpy.types.Operator):
 
     @classmethod
     def poll(cls, context: bpy.types.Context) -> bool:
-        if not cls._others(context):
-            return False
-
+        # Cheap checks first, the scan over the selection last.
         ob = context.object
-        return bool(context.mode == "OBJECT" and ob and ob.type == "MESH")
+        if not (context.mode == "OBJECT" and ob and ob.type == "MESH"):
+            return False
+        return cls._has_others(context)
 
     def execute(self, context: bpy.types.Context) -> set[str]:
         target = context.object
@@ -389,10 +479,9 @@ class LASERCUTSVGEXPORT_OT_boolean_cut(bpy.types.Operator):
             mod.object = target
             mod.operation = "DIFFERENCE"
 
-            # Move the operator to before any Solidify modifier.
-            with context.temp_override(object=ob):
-                bpy.ops.object.modifier_move_to_index(
-                    modifier=mod.name, index=0)
+            # Move the modifier to before any Solidify modifier. It was just
+            # added, so it is the last one.
+            ob.modifiers.move(len(ob.modifiers) - 1, 0)
 
         return {"FINISHED"}
 
@@ -405,6 +494,14 @@ class LASERCUTSVGEXPORT_OT_boolean_cut(bpy.types.Operator):
             if other_ob.type == "MESH" and ob != other_ob
         ]
 
+    @staticmethod
+    def _has_others(context: bpy.types.Context) -> bool:
+        ob = context.object
+        return any(
+            other_ob.type == "MESH" and ob != other_ob
+            for other_ob in context.selected_objects
+        )
+
 
 class LASERCUTSVGEXPORT_OT_mark_faces(bpy.types.Operator):
     bl_idname = "lasercut_svg_export.mark_faces"
@@ -418,31 +515,25 @@ class LASERCUTSVGEXPORT_OT_mark_faces(bpy.types.Operator):
     def poll(cls, context: bpy.types.Context) -> bool:
         if context.mode != 'EDIT_MESH':
             return False
-        bm = bmesh.from_edit_mesh(context.object.data)
-        selfaces = [f for f in bm.faces if f.select]
-        enabled = (len(selfaces) > 0)
-        bm.free()
-        return enabled
+        return context.object.data.total_face_sel > 0
 
     def execute(self, context: bpy.types.Context) -> set[str]:
-        # From https://docs.blender.org/api/current/bmesh.html#bmesh.from_edit_mesh and
         # Inspired by https://blender.stackexchange.com/questions/4964/setting-additional-properties-per-face
+        # The "lasercut" BMesh face layer is stored as an INT face attribute on
+        # the mesh, which can be written in bulk from object mode.
+        mesh = context.object.data
+        bpy.ops.object.mode_set(mode="OBJECT")
 
-        # Get a BMesh representation, we're in edit mode (see poll()), there is already a BMesh available
-        bm = bmesh.from_edit_mesh(context.object.data)
-
-        lasercut_layer_key = bm.faces.layers.int.get("lasercut")
-        if not lasercut_layer_key:
-            lasercut_layer_key = bm.faces.layers.int.new("lasercut")
-
-        for face in bm.faces:
-            if face.select:
-                face[lasercut_layer_key] = self.mark
+        attr = mesh.attributes.get("lasercut")
+        if attr is None:
+            attr = mesh.attributes.new("lasercut", "INT", "FACE")
 
-        # Finish up, write the bmesh back to the mesh
-        bmesh.update_edit_mesh(context.object.data)
-        bm.free()  # free and prevent further access
+        selected = _foreach_get(mesh.polygons, "select", np.bool_)
+        values = _foreach_get(attr.data, "value", np.int32)
+        values[selected] = self.mark
+        attr.data.foreach_set("value", values)
 
+        bpy.ops.object.mode_set(mode="EDIT")
         return {"FINISHED"}
 
 
@@ -456,15 +547,10 @@ class LASERCUTSVGEXPORT_OT_print_edges(bpy.types.Operator):
     def poll(cls, context: bpy.types.Context) -> bool:
         if context.mode != 'EDIT_MESH':
             return False
-        bm = bmesh.from_edit_mesh(context.object.data)
-        seledges = [e for e in bm.edges if e.select]
-        enabled = (len(seledges) > 0)
-        bm.free()
-        return enabled
+        return context.object.data.total_edge_sel > 0
 
     def execute(self, context: bpy.types.Context) -> set[str]:
         bm = bmesh.from_edit_mesh(context.object.data)
         seledges = [e for e in bm.edges if e.select]
         print(seledges)
-        bm.free()
         return {"FINISHED"}
@@ -13,22 +13,27 @@
 
 import sys
 import importlib
+import importlib.util
+import logging
+import math
 import time
+import zipimport
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 from types import ModuleType
 
+import numpy as np
 from mathutils import Vector
 
-is_first_load = "mesh_analysis" not in locals()
-if is_first_load:
-    from . import mesh_analysis
-else:
-    import importlib
+from . import mesh_analysis
 
-    mesh_analysis = importlib.reload(mesh_analysis)
+
+logger = logging.getLogger(__name__)
+
+_rectpack: Optional[ModuleType] = None
+"""The rectpack module, once loaded by `_load_rectpack()`."""
 
 
 @dataclass
@@ -69,13 +74,25 @@ def _linear_pack(
     options: mesh_analysis.Options,
 ) -> mesh_analysis.AABB:
     """Put all the shapes in a single row."""
-    next_x = 0.0
-    max_y = 0.0
-    for shape in shapes:
-        shape.translation.x = next_x - shape.aabb.min_x
-        next_x += shape.aabb.width + 2 * options.shape_padding
-        max_y = max(max_y, shape.aabb.max_y + options.shape_padding)
-
+    # Columns: min_x, width, max_y.
+    bounds = np.fromiter(
+        (
+            value
+            for shape in shapes
+            for value in (shape.aabb.min_x, shape.aabb.width, shape.aabb.max_y)
+        ),
+        dtype=np.float64,
+        count=3 * len(shapes),
+    ).reshape(-1, 3)
+    padded_widths = bounds[:, 1] + 2 * options.shape_padding
+    ends_x = np.cumsum(padded_widths)
+    starts_x = ends_x - padded_widths
+
+    for shape, translation_x in zip(shapes, (starts_x - bounds[:, 0]).tolist()):
+        shape.translation.x = translation_x
+
+    next_x = float(ends_x[-1]) if len(shapes) else 0.0
+    max_y = float((bounds[:, 2] + options.shape_padding).max(initial=0.0))
     return mesh_analysis.AABB(min_x=0, min_y=0, max_x=next_x, max_y=max_y)
 
 
@@ -104,95 +121,137 @@ def _smart_pack(
     packer.add_bin(_mm_to_int(pack_width), _mm_to_int(
         pack_length), count=float("inf"))
 
-    for shape_idx, shape in enumerate(shapes):
-        w_padded = shape.aabb.width + 2 * options.shape_padding
-        h_padded = shape.aabb.height + 2 * options.shape_padding
-        # if not (float("-inf") < w_padded < float("inf")):
-        print(f"shape_idx {shape_idx}, shape.aabb.width == {
-              shape.aabb.width} ")
-        # continue
-        # if not (float("-inf") < h_padded < float("inf")):
-        print(f"shape_idx {shape_idx}, shape.aabb.width == {
-              shape.aabb.height} ")
-        # continue
-        packer.add_rect(
-            _mm_to_int(w_padded),
-            _mm_to_int(h_padded),
-            shape_idx,
-        )
+    # Convert all sizes in one go, rather than per shape.
+    sizes = np.fromiter(
+        (dim for shape in shapes for dim in (shape.aabb.width, shape.aabb.height)),
+        dtype=np.float64,
+        count=2 * len(shapes),
+    ).reshape(-1, 2)
+    sizes_int = _mm_to_int_array(sizes + 2 * options.shape_padding)
+    add_rect = packer.add_rect
+    for shape_idx, (w_int, h_int) in enumerate(sizes_int.tolist()):
+        add_rect(w_int, h_int, shape_idx)
     packer.pack()
 
     if debug_svg_root is not None:
         svg_debug = ET.SubElement(debug_svg_root, "g", {
                                   "id": "smart-pack-debug"})
-        for rect in packer.rect_list():
-            _, x, y, w, h, shape_idx = rect
-            shape = shapes[shape_idx]
-            rect = ET.SubElement(svg_debug, "rect")
-            rect.set("x", str(_int_to_mm(x)))
-            rect.set("y", str(-_int_to_mm(y + h)))
-            rect.set("width", str(_int_to_mm(w)))
-            rect.set("height", str(_int_to_mm(h)))
-            rect.set("fill", "none")
-            rect.set("stroke", "teal")
-            rect.set("stroke-width", "0.2")
-            rect.set("id", f"debug-{shape.name}")
-
-    covered_areas: list[float] = []
-    packed_bounds = mesh_analysis.AABB()
-    margin_shift = Vector((options.margin, options.margin))
-    print("Rectangles:")
-    bin_idx_max = 0
-    for rect in packer.rect_list():
-        print(f"    {rect}")
-        bin_idx, x, y, w, h, shape_idx = rect
-
-        padded_position = Vector((_int_to_mm(x), _int_to_mm(y)))
-        padded_position.x += options.page_offset(bin_idx)
-        padded_size = Vector((_int_to_mm(w), _int_to_mm(h)))
-        packed_bounds.extend(padded_position)
-        packed_bounds.extend(padded_position + padded_size)
-
-        position = padded_position + margin_shift
-        size = padded_size - 2 * margin_shift
+        for _, x, y, w, h, shape_idx in packer.rect_list():
+            ET.SubElement(
+                svg_debug,
+                "rect",
+                {
+                    "x": str(_int_to_mm(x)),
+                    "y": str(-_int_to_mm(y + h)),
+                    "width": str(_int_to_mm(w)),
+                    "height": str(_int_to_mm(h)),
+                    "fill": "none",
+                    "stroke": "teal",
+                    "stroke-width": "0.2",
+                    "id": f"debug-{shapes[shape_idx].name}",
+                },
+            )
+
+    # Columns: bin index, x, y, width, height, shape index.
+    rects = np.array(packer.rect_list(), dtype=np.int64).reshape(-1, 6)
+    logger.debug("packed rectangles:\n%s", rects)
+    bin_indices = rects[:, 0]
+    num_pages = int(bin_indices.max()) + 1 if len(rects) else 1
+    page_offsets = np.array([options.page_offset(idx) for idx in range(num_pages)])
+
+    padded_positions = rects[:, 1:3] / 1000.0
+    padded_positions[:, 0] += page_offsets[bin_indices]
+    padded_sizes = rects[:, 3:5] / 1000.0
+    packed_bounds = mesh_analysis.AABB.from_points(
+        np.concatenate((padded_positions, padded_positions + padded_sizes))
+    )
+    covered_area = float(np.prod(padded_sizes, axis=1).sum())
+
+    # Only the shapes themselves still need a per-rectangle loop.
+    margin = options.margin
+    for (x, y), (w, h), bin_idx, shape_idx in zip(
+        padded_positions.tolist(),
+        padded_sizes.tolist(),
+        bin_indices.tolist(),
+        rects[:, 5].tolist(),
+    ):
         shape = shapes[shape_idx]
-        shape.transform_into(position, size)
+        shape.transform_into(
+            Vector((x + margin, y + margin)),
+            Vector((w - 2 * margin, h - 2 * margin)),
+        )
         shape.page_num = bin_idx
-        covered_areas.append(padded_size.x * padded_size.y)
-        bin_idx_max = max(bin_idx_max, bin_idx)
 
     return PackResult(
         canvas_bounds=packed_bounds,
-        covered_area=sum(covered_areas),
-        num_pages=bin_idx_max + 1,
+        covered_area=covered_area,
+        num_pages=num_pages,
     )
 
 
 # Conversion functions for rectpack, it only handles integers.
 def _mm_to_int(mm: float) -> int:
     """Convert float in millimeters to int in micrometers."""
-    if not (float("-inf") < mm < float("inf")):
+    if not math.isfinite(mm):
         raise ValueError("sizes must be finite")
     return int(mm * 1000)
 
 
+def _mm_to_int_array(mm: np.ndarray) -> np.ndarray:
+    """Convert array of floats in millimeters to ints in micrometers."""
+    if not np.isfinite(mm).all():
+        raise ValueError("sizes must be finite")
+    return (mm * 1000).astype(np.int64)
+
+
 def _int_to_mm(int_: int) -> float:
     """Convert int in micrometers to float in millimeters."""
     return int_ / 1000.0
 
 
 def _load_rectpack() -> ModuleType:
+    global _rectpack
+    if _rectpack is not None:
+        return _rectpack
+
     try:
-        return sys.modules["rectpack"]
+        _rectpack = sys.modules["rectpack"]
+        return _rectpack
     except KeyError:
         pass
 
-    old_syspath = sys.path[:]
-    my_dir = Path(__file__).absolute().parent
-
-    sys.path.append(str(my_dir / "rectpack-0.2.2-py3.9.egg"))
-    print(sys.path)
-    rectpack = importlib.import_module("rectpack")
-    sys.path = old_syspath
+    # Load straight from the bundled egg, instead of putting it on sys.path and
+    # having every importer search it. Without the egg, fall back to a normally
+    # installed rectpack.
+    egg_path = Path(__file__).absolute().parent / "rectpack-0.2.2-py3.9.egg"
+    if not egg_path.exists():
+        try:
+            rectpack = importlib.import_module("rectpack")
+        except ImportError as ex:
+            raise ImportError(
+                f"rectpack is not installed, and not bundled at {egg_path}"
+            ) from ex
+        _rectpack = rectpack
+        return rectpack
+
+    if egg_path.is_dir():
+        spec = importlib.util.spec_from_file_location(
+            "rectpack", egg_path / "rectpack" / "__init__.py"
+        )
+    else:
+        spec = zipimport.zipimporter(str(egg_path)).find_spec("rectpack")
+    if spec is None:
+        raise ImportError(f"rectpack not found in {egg_path}")
+    logger.debug("loading rectpack from %s", egg_path)
+
+    rectpack = importlib.util.module_from_spec(spec)
+    # Must be registered before executing, for its own relative imports.
+    sys.modules["rectpack"] = rectpack
+    try:
+        spec.loader.exec_module(rectpack)
+    except BaseException:
+        del sys.modules["rectpack"]
+        raise
 
+    _rectpack = rectpack
     return rectpack
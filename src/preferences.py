@@ -11,19 +11,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-if "bpy" in locals():
-    import importlib
-    importlib.reload(enums)
-    importlib.reload(props)
-else:
-    from . import enums
-    from . import props
+from . import enums
+from . import props
 
 import bpy
 
+_timer_scheduled = False
+_last_defaults: tuple | None = None
+
+
 def update_defaults(prefs: "LasercutSvgExportPreferences", context: bpy.types.Context) -> None:
+    global _last_defaults
+
+    # Blender also calls this when nothing actually changed, so skip those.
+    cur = (
+        prefs.laser_width,
+        prefs.material_width,
+        prefs.material_length,
+        prefs.material_thickness,
+        prefs.margin,
+        prefs.shape_padding,
+        prefs.pack_sort,
+        prefs.pack_may_rotate,
+    )
+    if cur == _last_defaults:
+        return
+    _last_defaults = cur
+
+    _schedule_defaults_update(context)
+
+
+def _schedule_defaults_update(context: bpy.types.Context) -> None:
+    """Re-register the scene properties shortly after the last preference change.
+
+    Dragging a slider calls the update callback for every intermediate value,
+    so collapse those bursts into a single re-registration.
+    """
+    global _timer_scheduled
+    if _timer_scheduled:
+        return
+    _timer_scheduled = True
+    bpy.app.timers.register(_flush_defaults, first_interval=0.1)
+
+
+def _flush_defaults() -> None:
+    global _timer_scheduled
+    _timer_scheduled = False
     props.unregister_scene_props()
     props.register_scene_props()
+    return None  # Don't repeat the timer.
+
+
+def cancel_defaults_update() -> None:
+    global _timer_scheduled
+    if bpy.app.timers.is_registered(_flush_defaults):
+        bpy.app.timers.unregister(_flush_defaults)
+    _timer_scheduled = False
 
 
 class LasercutSvgExportPreferences(bpy.types.AddonPreferences):
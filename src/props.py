@@ -11,100 +11,145 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-if "bpy" in locals():
-    import importlib
-    importlib.reload(enums)
-else:
-    from . import enums
+from . import enums
 
 import bpy
 
+_LASER_WIDTH_DESC = (
+    "Compensate for material removed by the laser. Edges marked as 'sharp' will be "
+    "moved by half this amount before exporting to SVG"
+)
+_MATERIAL_WIDTH_DESC = "The shape packing will attempt to fill the material width"
+_MATERIAL_LENGTH_DESC = "The shape packing will attempt to fill the material length"
+_MATERIAL_THICKNESS_DESC = "The thickness of the to-be-cut material"
+_MARGIN_DESC = "The distance from the edge of the material to the closest shape"
+_SHAPE_PADDING_DESC = (
+    "The shape packing will keep this distance as padding around each shape. The padding will be "
+    "double between shapes, and single between the shape and the outer edge of the document"
+)
+_PACK_SORT_DESC = (
+    "The shape packing will sort the bounding boxes of the shapes before trying to pack them. "
+    "Different sorting approaches will be useful for different situations (square shapes vs. longer shapes, etc.)"
+)
+_PACK_MAY_ROTATE_DESC = "Whether the shape packing algorithm is allowed to rotate shapes by 90 degrees or not"
+
+
+# Scene properties as (name, property type, keyword arguments). Properties
+# without an explicit default take it from the add-on preference of the
+# same name.
+_SCENE_PROPS = (
+    (
+        "laser_width",
+        bpy.props.FloatProperty,
+        dict(
+            name="Laser Width",
+            description=_LASER_WIDTH_DESC,
+            min=0.0,
+            max=10.0,
+            soft_max=1.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "material_width",
+        bpy.props.FloatProperty,
+        dict(
+            name="Material Width",
+            description=_MATERIAL_WIDTH_DESC,
+            min=0.0,
+            max=100000.0,
+            soft_max=500.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "material_length",
+        bpy.props.FloatProperty,
+        dict(
+            name="Material Length",
+            description=_MATERIAL_LENGTH_DESC,
+            min=0.0,
+            max=100000.0,
+            soft_max=500.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "material_thickness",
+        bpy.props.FloatProperty,
+        dict(
+            name="Mat. Thickness",
+            description=_MATERIAL_THICKNESS_DESC,
+            min=0.0,
+            soft_max=10.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "margin",
+        bpy.props.FloatProperty,
+        dict(
+            name="Margin",
+            description=_MARGIN_DESC,
+            default=5.0,
+            min=0.0,
+            soft_max=50.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "shape_padding",
+        bpy.props.FloatProperty,
+        dict(
+            name="Shape Padding",
+            description=_SHAPE_PADDING_DESC,
+            min=0.0,
+            max=50.0,
+            soft_max=5.0,
+            subtype="DISTANCE",
+            unit="LENGTH",
+        ),
+    ),
+    (
+        "pack_sort",
+        bpy.props.EnumProperty,
+        dict(
+            name="Pack Sorting",
+            items=enums.pack_sort_items,
+            description=_PACK_SORT_DESC,
+        ),
+    ),
+    (
+        "pack_may_rotate",
+        bpy.props.BoolProperty,
+        dict(
+            name="Allow Rotation",
+            description=_PACK_MAY_ROTATE_DESC,
+        ),
+    ),
+)
+
 
 def register_scene_props() -> None:
     prefs = bpy.context.preferences.addons[__package__].preferences
-    bpy.types.Scene.lasercut_svg_export_laser_width = bpy.props.FloatProperty(
-        name="Laser Width",
-        description="Compensate for material removed by the laser. Edges marked as 'sharp' will be "
-        "moved by half this amount before exporting to SVG",
-        default=prefs.laser_width,
-        min=0.0,
-        max=10.0,
-        soft_max=1.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_material_width = bpy.props.FloatProperty(
-        name="Material Width",
-        description="The shape packing will attempt to fill the material width",
-        default=prefs.material_width,
-        min=0.0,
-        max=100000.0,
-        soft_max=500.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_material_length = bpy.props.FloatProperty(
-        name="Material Length",
-        description="The shape packing will attempt to fill the material length",
-        default=prefs.material_length,
-        min=0.0,
-        max=100000.0,
-        soft_max=500.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_material_thickness = bpy.props.FloatProperty(
-        name="Mat. Thickness",
-        description="The thickness of the to-be-cut material",
-        default=prefs.material_thickness,
-        min=0.0,
-        soft_max=10.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_margin = bpy.props.FloatProperty(
-        name="Margin",
-        description="The distance from the edge of the material to the closest shape",
-        default=5.0,
-        min=0.0,
-        soft_max=50.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_shape_padding = bpy.props.FloatProperty(
-        name="Shape Padding",
-        description="The shape packing will keep this distance as padding around each shape. The padding will be "
-        "double between shapes, and single between the shape and the outer edge of the document",
-        default=prefs.shape_padding,
-        min=0.0,
-        max=50.0,
-        soft_max=5.0,
-        subtype="DISTANCE",
-        unit="LENGTH",
-    )
-    bpy.types.Scene.lasercut_svg_export_pack_sort = bpy.props.EnumProperty(
-        name="Pack Sorting",
-        items=enums.pack_sort_items,
-        description="The shape packing will sort the bounding boxes of the shapes before trying to pack them. "
-        "Different sorting approaches will be useful for different situations (square shapes vs. longer shapes, etc.)",
-        default=prefs.pack_sort,
-    )
-    bpy.types.Scene.lasercut_svg_export_pack_may_rotate = bpy.props.BoolProperty(
-        name="Allow Rotation",
-        description="Whether the shape packing algorithm is allowed to rotate shapes by 90 degrees or not",
-        default=prefs.pack_may_rotate,
-    )
+    for name, prop_type, kwargs in _SCENE_PROPS:
+        if "default" not in kwargs:
+            kwargs = {**kwargs, "default": getattr(prefs, name)}
+        setattr(bpy.types.Scene, f"lasercut_svg_export_{name}", prop_type(**kwargs))
 
 
 def unregister_scene_props() -> None:
-    del bpy.types.Scene.lasercut_svg_export_laser_width
-    del bpy.types.Scene.lasercut_svg_export_material_width
-    del bpy.types.Scene.lasercut_svg_export_material_length
-    del bpy.types.Scene.lasercut_svg_export_material_thickness
-    del bpy.types.Scene.lasercut_svg_export_margin
-    del bpy.types.Scene.lasercut_svg_export_shape_padding
-    del bpy.types.Scene.lasercut_svg_export_pack_sort
-    del bpy.types.Scene.lasercut_svg_export_pack_may_rotate
+    # Tolerate partially registered properties, so that one missing property
+    # doesn't leave the others behind on the Scene type.
+    for name, _, _ in _SCENE_PROPS:
+        attr = f"lasercut_svg_export_{name}"
+        if hasattr(bpy.types.Scene, attr):
+            delattr(bpy.types.Scene, attr)
 
 
 def register_object_props() -> None:
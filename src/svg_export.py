@@ -11,24 +11,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from typing import Iterable, Iterator
+from typing import BinaryIO, Iterable, Iterator
 from pathlib import Path
 import contextlib
 import copy
 import math
-import xml.etree.ElementTree as ET
+import operator
+import os
+import tempfile
+from xml.sax.saxutils import XMLGenerator
 
 import bpy
+import numpy as np
 from mathutils import Vector
 
-is_first_load = "mesh_analysis" not in locals()
-if is_first_load:
-    from . import mesh_analysis, packing
-else:
-    import importlib
-
-    mesh_analysis = importlib.reload(mesh_analysis)
-    packing = importlib.reload(packing)
+from . import mesh_analysis, packing
 
 # <?xml version="1.0" encoding="UTF-8" standalone="no"?>
 # <!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
@@ -45,14 +42,23 @@ else:
 NS_SVG = "http://www.w3.org/2000/svg"
 NS_SODIPODI = "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
 NS_INKSCAPE = "http://www.inkscape.org/namespaces/inkscape"
+TAG_SODIPODI_NAMEDVIEW = "sodipodi:namedview"
+TAG_INKSCAPE_PAGE = "inkscape:page"
 
 
 colors = {
-    mesh_analysis.MeshType.CUT.name: "red",
-    mesh_analysis.MeshType.ENGRAVE.name: "blue",
+    mesh_analysis.MeshType.CUT: "red",
+    mesh_analysis.MeshType.ENGRAVE: "blue",
 }
 
 
+# Attributes shared by all exported polygons and polylines.
+_POLY_ATTRIBS = {"fill": "none", "stroke-width": "0.1mm"}
+
+# Shape group transform, formatted as (precision, x, precision, y, rotation).
+_TRANSFORM_FMT = "translate(%.*f,%.*f) rotate(%s) "
+
+
 class NoShapes(RuntimeError):
     """Raised when there are no shapes to export."""
 
@@ -69,66 +75,99 @@ def write(
     """
     shapes = _collect_shapes(depsgraph, objects, options)
 
-    ET.register_namespace("", NS_SVG)
-    ET.register_namespace("sodipodi", NS_SODIPODI)
-    ET.register_namespace("inkscape", NS_INKSCAPE)
-    root = ET.Element("svg", {"version": "1.1"})
-
-    # pack_result = packing.pack(shapes, options, debug_svg_root=root)
     pack_result = packing.pack(shapes, options)
 
     if not pack_result:
         raise NoShapes("No shapes to pack")
 
-    _write_document_sizes(root, options, pack_result)
-
-    # Create an SVG layer per page.
-    page_layers = [
-        _layer(root, f"page-{page_idx}", f"Page {page_idx}")
-        for page_idx in range(1, pack_result.num_pages + 1)
+    # Group the shapes per page, so that each page layer is written in one go.
+    page_shapes: list[list[mesh_analysis.MeshBoundary]] = [
+        [] for _ in range(pack_result.num_pages)
     ]
-
-    # Export shapes
     for shape in shapes:
-        layer = page_layers[shape.page_num]
-        _write_shape(layer, shape)
-
-    # Export annotations
-    if options.shape_table:
-        layer_annotations = _layer(root, "layer-annotations", "Annotations")
-        _write_shape_table(layer_annotations, shapes, options)
-        # _write_shape_labels(layer_annotations, shapes, options)
-
-    tree = ET.ElementTree(root)
-    with out_path.open("wb") as outfile:
-        tree.write(
-            outfile,
-            encoding="utf-8",
-            xml_declaration=True,
-        )
+        page_shapes[shape.page_num].append(shape)
+
+    # The document is streamed to a temporary file, instead of building the
+    # entire element tree in memory first. The generator writes many small
+    # pieces, so a 1 MiB buffer keeps the number of write syscalls down.
+    with _replace_on_success(out_path) as outfile:
+        xml = XMLGenerator(outfile, "utf-8", short_empty_elements=True)
+        xml.startDocument()
+        root_attribs = {
+            "xmlns:inkscape": NS_INKSCAPE,
+            "xmlns:sodipodi": NS_SODIPODI,
+            "version": "1.1",
+            **_document_sizes(options),
+        }
+        with _element(xml, "svg", root_attribs):
+            _write_named_view(xml, options, pack_result)
+
+            # Create an SVG layer per page, and export the shapes.
+            for page_idx, shapes_on_page in enumerate(page_shapes, start=1):
+                with _layer(xml, f"page-{page_idx}", f"Page {page_idx}"):
+                    for shape in shapes_on_page:
+                        _write_shape(xml, shape, options.svg_precision)
+
+            # Export annotations
+            if options.shape_table:
+                with _layer(xml, "layer-annotations", "Annotations"):
+                    _write_shape_table(xml, shapes, options)
+                    # _write_shape_labels(xml, shapes, options)
+        xml.endDocument()
 
     width = int(options.page_offset(pack_result.num_pages))
     height = int(options.material_length)
     return width, height
 
 
-def _write_document_sizes(
-    root: ET.Element,
-    options: mesh_analysis.Options,
-    pack_result: packing.PackResult,
-) -> None:
+@contextlib.contextmanager
+def _replace_on_success(out_path: Path) -> Iterator[BinaryIO]:
+    """Yield a file that replaces `out_path` once the with-statement succeeds.
+
+    The file is written next to `out_path`, so that the final replace is a
+    rename on the same file system. On errors the temporary file is removed,
+    and any existing file at `out_path` is left untouched.
+    """
+    fd, tmp_name = tempfile.mkstemp(
+        dir=out_path.parent, prefix=f".{out_path.name}.", suffix=".tmp"
+    )
+    tmp_path = Path(tmp_name)
+    try:
+        # Wrap the descriptor first, so that it is closed whatever happens.
+        with open(fd, "wb", buffering=1 << 20) as outfile:
+            # mkstemp() creates the file private to the user, whereas the
+            # export should get the same permissions as any other newly
+            # created file. Passing a path works on all platforms, unlike a
+            # file descriptor.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+            yield outfile
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _document_sizes(options: mesh_analysis.Options) -> dict[str, str]:
+    """Return the size attributes of the root SVG element."""
     # canvas_size = _compute_canvas_size(pack_result.canvas_bounds, options)
     page_size: tuple[float, float] = (
         int(round(options.material_width)),
         int(round(options.material_length)),
     )
-    root.set("width", f"{page_size[0]}mm")
-    root.set("height", f"{page_size[1]}mm")
-    root.set(
-        "viewBox",
-        f"0 {-page_size[1]} {page_size[0]} {page_size[1]}",
-    )
+    return {
+        "width": f"{page_size[0]}mm",
+        "height": f"{page_size[1]}mm",
+        "viewBox": f"0 {-page_size[1]} {page_size[0]} {page_size[1]}",
+    }
+
 
+def _write_named_view(
+    xml: XMLGenerator,
+    options: mesh_analysis.Options,
+    pack_result: packing.PackResult,
+) -> None:
     #   <sodipodi:namedview>
     #     <inkscape:page
     #        x="0"
@@ -144,19 +183,21 @@ def _write_document_sizes(
     #        id="page379" />
     #   </sodipodi:namedview>
 
-    namedview = ET.SubElement(root, "{%s}namedview" % NS_SODIPODI)
-    for page_idx in range(pack_result.num_pages):
-        ET.SubElement(
-            namedview,
-            "{%s}page" % NS_INKSCAPE,
-            {
-                "id": f"page{page_idx}",
-                "x": str(options.page_offset(page_idx)),
-                "y": "0",
-                "width": str(page_size[0]),
-                "height": str(page_size[1]),
-            },
-        )
+    width = str(int(round(options.material_width)))
+    height = str(int(round(options.material_length)))
+    with _element(xml, TAG_SODIPODI_NAMEDVIEW, {}):
+        for page_idx in range(pack_result.num_pages):
+            _leaf(
+                xml,
+                TAG_INKSCAPE_PAGE,
+                {
+                    "id": f"page{page_idx}",
+                    "x": str(options.page_offset(page_idx)),
+                    "y": "0",
+                    "width": width,
+                    "height": height,
+                },
+            )
 
 
 def _collect_shapes(
@@ -166,8 +207,8 @@ def _collect_shapes(
 ) -> list[mesh_analysis.MeshBoundary]:
     """Convert meshes to 2D shapes and their AABBs."""
     shapes: list[mesh_analysis.MeshBoundary] = []
-    for object in objects:
-        with _solidify_disabled(depsgraph, object) as ob_eval:
+    with _solidify_disabled(depsgraph, objects) as obs_eval:
+        for ob_eval in obs_eval:
             mesh_boundary = mesh_analysis.flatten_mesh(ob_eval, options)
             print(f"TODO change logic from here. {mesh_boundary}")
             shapes.append(mesh_boundary)
@@ -175,40 +216,76 @@ def _collect_shapes(
 
 
 def _write_shape(
-    root: ET.Element,
+    xml: XMLGenerator,
     shape: mesh_analysis.MeshBoundary,
+    precision: int,
 ) -> None:
-    ob_group = ET.SubElement(root, "g", {"id": shape.name})
-
-    # print("_write_shape:")
-    poly_iter = shape.polygons_by_type()
-    for mesh_idx, (mesh_type, flat_mesh) in enumerate(poly_iter):
-        points = " ".join(
-            f"{v.x:.6},{-v.y:.6}" for v in flat_mesh.iter_points())
-        # print(f"poly: {points}  (closed={poly_closed})" )
-
-        svg_element = "polygon" if flat_mesh.is_closed else "polyline"
-        polygon = ET.SubElement(ob_group, svg_element)
-        polygon.set("points", points)
-        polygon.set("fill", "none")
-        polygon.set("stroke", colors[mesh_type.name])
-        polygon.set("stroke-width", "0.1mm")
-        polygon.set("id", f"{shape.name}-p{mesh_idx}")
-
-    ob_group.set(
-        "transform",
-        f"translate({shape.translation.x:.6},{-shape.translation.y:.6}) "
-        f"rotate({shape.rotation}) ",
+    transform = _TRANSFORM_FMT % (
+        precision,
+        shape.translation.x,
+        precision,
+        -shape.translation.y,
+        shape.rotation,
     )
+    with _element(xml, "g", {"id": shape.name, "transform": transform}):
+        # print("_write_shape:")
+        poly_iter = shape.polygons_by_type()
+        for mesh_idx, (mesh_type, flat_mesh) in enumerate(poly_iter):
+            points = _format_points(flat_mesh.points(), precision)
+            # print(f"poly: {points}  (closed={poly_closed})" )
+
+            svg_element = "polygon" if flat_mesh.is_closed else "polyline"
+            _leaf(
+                xml,
+                svg_element,
+                {
+                    **_POLY_ATTRIBS,
+                    "points": points,
+                    "stroke": colors[mesh_type],
+                    "id": f"{shape.name}-p{mesh_idx}",
+                },
+            )
+
+
+def _format_points(points: np.ndarray, precision: int) -> str:
+    """Format (N, 2) points as SVG 'x,y x,y ...', flipping the Y-axis.
+
+    All coordinates go through a single %-formatting call, rather than one
+    f-string per point.
+    """
+    coords = points.astype(np.float64)
+    coords[:, 1] *= -1
+    point_format = f"%.{precision}f,%.{precision}f"
+    return " ".join([point_format] * len(coords)) % tuple(coords.ravel().tolist())
+
+
+@contextlib.contextmanager
+def _element(xml: XMLGenerator, tag: str, attribs: dict[str, str]) -> Iterator[None]:
+    """Write the start tag, and the end tag after the body of the with-statement."""
+    xml.startElement(tag, attribs)
+    try:
+        yield
+    finally:
+        xml.endElement(tag)
+
+
+def _leaf(
+    xml: XMLGenerator, tag: str, attribs: dict[str, str], text: str = ""
+) -> None:
+    """Write an element without children, optionally with text content."""
+    xml.startElement(tag, attribs)
+    if text:
+        xml.characters(text)
+    xml.endElement(tag)
 
 
 def _layer(
-    root: ET.Element,
+    xml: XMLGenerator,
     layer_id: str,
     layer_name: str,
-) -> ET.Element:
-    return ET.SubElement(
-        root,
+) -> contextlib.AbstractContextManager[None]:
+    return _element(
+        xml,
         "g",
         {
             "id": layer_id,
@@ -219,73 +296,86 @@ def _layer(
 
 
 def _write_shape_table(
-    root: ET.Element,
+    xml: XMLGenerator,
     shapes: list[mesh_analysis.MeshBoundary],
     options: mesh_analysis.Options,
 ) -> None:
-    # Construct the table data as (name, width, height) list.
-    table: list[tuple[str, str, str]] = []
-    for shape in shapes:
-        w = shape.aabb.width - options.laser_width
-        h = shape.aabb.height - options.laser_width
-        surface = (w / 1000.0) * (h / 1000.0)
-        item = (shape.name, f"{w:.0f}", f"{h:.0f}", f"{surface:.3f}")
-        table.append(item)
+    # Compute the sizes of all shapes in one go.
+    sizes = np.array(
+        [(shape.aabb.width, shape.aabb.height) for shape in shapes],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    sizes -= options.laser_width
+    surfaces = (sizes[:, 0] / 1000.0) * (sizes[:, 1] / 1000.0)
+
+    # Construct the table data as (name, width, height, surface) list.
+    table: list[tuple[str, str, str, str]] = [
+        (shape.name, f"{w:.0f}", f"{h:.0f}", f"{surface:.3f}")
+        for shape, (w, h), surface in zip(shapes, sizes.tolist(), surfaces.tolist())
+    ]
 
-    table.sort()  # sort by name
+    # Sort by name only; this is linear for input that is already in order.
+    table.sort(key=operator.itemgetter(0))
     table.insert(0, ("Shape", "Width (mm)", "Height (mm)", "Surface (m²)"))
 
-    svg_group = ET.SubElement(root, "g", {"id": "flatterer-shape-table"})
-
     colour = "#f36926"
     columns = [5, 100, 150, 200]
     box_top = 10
     box_width = columns[-1] + box_top
     line_height = 9
-    for row_idx, row in enumerate(table):
-        y = (row_idx + 2) * line_height
-
-        if row_idx < len(table) - 1:
-            line_y = y + 2
-            outline = ET.SubElement(
-                svg_group,
-                "line",
-                {
-                    "x1": f"{0}",
-                    "y1": f"{line_y}",
-                    "x2": f"{box_width}",
-                    "y2": f"{line_y}",
-                    "stroke": colour,
-                    "stroke-width": "0.1mm",
-                },
-            )
 
-        font_weight = "bold" if row_idx == 0 else "normal"
-        font_style = f'font-size:4pt; font-family:"Noto Sans", sans-serif; font-weight:{
-            font_weight}'
-
-        for row_idx, value in enumerate(row):
-            x = columns[row_idx]
-            txt_elt = ET.SubElement(svg_group, "text")
-            txt_elt.set("x", f"{x}")
-            txt_elt.set("y", f"{y}")
-            txt_elt.set("style", font_style)
-            if row_idx > 0:
-                txt_elt.set("text-anchor", "end")
-            txt_elt.text = f"{value}"
-
-    outline = ET.SubElement(svg_group, "rect")
-    outline.set("x", "0")
-    outline.set("y", f"{box_top}")
-    outline.set("width", f"{box_width}")
-    outline.set("height", f"{(len(table) + 0.5) * line_height}")
-    outline.set("fill", "none")
-    outline.set("stroke", colour)
-    outline.set("stroke-width", "0.3mm")
+    font_style = 'font-size:4pt; font-family:"Noto Sans", sans-serif; font-weight:'
+    font_style_bold = font_style + "bold"
+    font_style_normal = font_style + "normal"
+    x_values = [f"{x}" for x in columns]
+    box_width_str = f"{box_width}"
+    last_row_idx = len(table) - 1
+    leaf = _leaf  # Local name, as this is called for every table cell.
+
+    with _element(xml, "g", {"id": "flatterer-shape-table"}):
+        for row_idx, row in enumerate(table):
+            y = (row_idx + 2) * line_height
+
+            if row_idx < last_row_idx:
+                line_y = f"{y + 2}"
+                leaf(
+                    xml,
+                    "line",
+                    {
+                        "x1": "0",
+                        "y1": line_y,
+                        "x2": box_width_str,
+                        "y2": line_y,
+                        "stroke": colour,
+                        "stroke-width": "0.1mm",
+                    },
+                )
+
+            y_str = f"{y}"
+            row_style = font_style_bold if row_idx == 0 else font_style_normal
+            for col_idx, value in enumerate(row):
+                txt_attribs = {"x": x_values[col_idx], "y": y_str, "style": row_style}
+                if col_idx > 0:
+                    txt_attribs["text-anchor"] = "end"
+                leaf(xml, "text", txt_attribs, f"{value}")
+
+        _leaf(
+            xml,
+            "rect",
+            {
+                "x": "0",
+                "y": f"{box_top}",
+                "width": f"{box_width}",
+                "height": f"{(len(table) + 0.5) * line_height}",
+                "fill": "none",
+                "stroke": colour,
+                "stroke-width": "0.3mm",
+            },
+        )
 
 
 def _write_shape_labels(
-    root: ET.Element,
+    xml: XMLGenerator,
     shapes: list[mesh_analysis.MeshBoundary],
     options: mesh_analysis.Options,
 ) -> None:
@@ -295,8 +385,8 @@ def _write_shape_labels(
         label_x = shape.aabb.mid_x
         label_y = shape.aabb.mid_y
 
-        txt_elt = ET.SubElement(
-            root,
+        _leaf(
+            xml,
             "text",
             {
                 "x": f"{label_x}mm",
@@ -305,39 +395,53 @@ def _write_shape_labels(
                 "text-anchor": "middle",
                 "writing-mode": "tb" if shape.aabb.width < shape.aabb.height else "lr",
             },
+            shape.name,
         )
-        txt_elt.text = shape.name
 
 
 @contextlib.contextmanager
 def _solidify_disabled(
-    depsgraph: bpy.types.Depsgraph, object: bpy.types.Object
-) -> Iterator[bpy.types.Object]:
-    modifier_state = _solidify_disable(object)
+    depsgraph: bpy.types.Depsgraph, objects: Iterable[bpy.types.Object]
+) -> Iterator[list[bpy.types.Object]]:
+    """Yield the evaluated objects, with their Solidify modifiers disabled.
+
+    The modifiers of all objects are disabled first, so that the depsgraph
+    only has to be updated once, instead of once per object.
+    """
+    objects = list(objects)
+    # Scan the modifier stacks once, and share the result between the
+    # disabling and re-enabling of the modifiers.
+    modifier_lists = [_solidify_modifiers(object) for object in objects]
+    modifier_states: list[list[bool]] = []
     try:
+        for object, modifiers in zip(objects, modifier_lists):
+            modifier_states.append(_solidify_disable(object, modifiers))
         depsgraph.update()
-        yield object.evaluated_get(depsgraph)
+        yield [object.evaluated_get(depsgraph) for object in objects]
     finally:
-        _solidify_enable(object, modifier_state)
+        for modifiers, modifier_state in zip(modifier_lists, modifier_states):
+            _solidify_enable(modifiers, modifier_state)
 
 
-def _solidify_disable(object: bpy.types.Object) -> dict[str, bool]:
-    modifier_state = {}
-    for modifier in _solidify_modifiers(object):
-        modifier_state[modifier.name] = modifier.show_viewport
-        if not modifier.show_viewport:
+def _solidify_disable(
+    object: bpy.types.Object, modifiers: list[bpy.types.Modifier]
+) -> list[bool]:
+    """Disable the modifiers, returning their previous visibility."""
+    modifier_state = [modifier.show_viewport for modifier in modifiers]
+    for modifier, visible in zip(modifiers, modifier_state):
+        if not visible:
             continue
         object.update_tag(refresh={"OBJECT", "DATA"})
         modifier.show_viewport = False
     return modifier_state
 
 
-def _solidify_enable(object: bpy.types.Object, modifier_state: dict[str, bool]) -> None:
-    for modifier in _solidify_modifiers(object):
-        modifier.show_viewport = modifier_state[modifier.name]
+def _solidify_enable(
+    modifiers: list[bpy.types.Modifier], modifier_state: list[bool]
+) -> None:
+    for modifier, visible in zip(modifiers, modifier_state):
+        modifier.show_viewport = visible
 
 
-def _solidify_modifiers(object: bpy.types.Object) -> Iterable[bpy.types.Modifier]:
-    for modifier in object.modifiers:
-        if modifier.type == "SOLIDIFY":
-            yield modifier
+def _solidify_modifiers(object: bpy.types.Object) -> list[bpy.types.Modifier]:
+    return [modifier for modifier in object.modifiers if modifier.type == "SOLIDIFY"]